@@ -0,0 +1,158 @@
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from gen import load_texts, build_sentence_markov_chain, generate_from_chain
+
+# Integer form of a Markov chain: sorted (n_contexts, order) word-id table with CSR successor lists.
+# next_rows maps every successor entry to the row of the context it leads to (-1 for a dead end),
+# so a chain's state is just a row index and no context ever has to fit into a fixed-width key
+CompiledChain = namedtuple('CompiledChain', ['vocab', 'order', 'contexts', 'offsets', 'successors', 'next_rows'])
+
+# Function to convert a dict-of-lists Markov chain into sorted integer tables
+def compile_chain(chain):
+    if not chain:
+        raise ValueError("Cannot compile an empty Markov chain")
+    order = len(next(iter(chain)))
+
+    words = set()
+    for state, next_words in chain.items():
+        words.update(state)
+        words.update(next_words)
+    vocab = sorted(words)
+    word_ids = {word: i for i, word in enumerate(vocab)}
+
+    # Word ids follow sorted word order, so sorting word tuples sorts the id rows too
+    states = sorted(chain)
+    rows = {state: i for i, state in enumerate(states)}
+    contexts = np.array([[word_ids[w] for w in state] for state in states], dtype=np.int64).reshape(len(states), order)
+
+    offsets = np.zeros(len(states) + 1, dtype=np.int64)
+    successors = []
+    next_rows = []
+    for i, state in enumerate(states):
+        tail = state[1:]
+        for word in chain[state]:
+            successors.append(word_ids[word])
+            next_rows.append(rows.get(tail + (word,), -1))
+        offsets[i + 1] = len(successors)
+
+    return CompiledChain(vocab, order, contexts, offsets,
+                         np.asarray(successors, dtype=np.int64), np.asarray(next_rows, dtype=np.int64))
+
+# Function to advance one independent chain per seed in lockstep, returning word-id rows of `length`.
+# Any int is a valid seed: negative seeds are converted with abs(), the same way random.seed treats them,
+# because np.random.default_rng only accepts non-negative ones
+def generate_ids_batch(compiled, seeds, length):
+    n_rows = len(seeds)
+    order = compiled.order
+    n_contexts = len(compiled.contexts)
+    if n_rows == 0 or length <= 0:
+        return np.zeros((n_rows, max(length, 0)), dtype=np.int64)
+
+    # Each book draws from its own stream so its output depends only on its seed,
+    # never on which other books happen to share the batch. Every step advances a
+    # row by at least one word, so `length` draws per row always suffice
+    draws = np.stack([np.random.default_rng(abs(seed)).random(length) for seed in seeds])
+
+    out = np.empty((n_rows, length + order), dtype=np.int64)
+    rows = np.arange(n_rows)
+
+    # Start every chain from a random context; state holds the current context row
+    state = (draws[:, 0] * n_contexts).astype(np.int64)
+    out[:, :order] = compiled.contexts[state]
+    pos = np.full(n_rows, order, dtype=np.int64)
+
+    step = 1
+    while step < length:
+        active = pos < length
+        if not active.any():
+            break
+        u = draws[:, step]
+        step += 1
+
+        # Rows in a known context append one sampled successor and jump to its context row
+        hit = active & (state >= 0)
+        if hit.any():
+            ctx = state[hit]
+            lo = compiled.offsets[ctx]
+            width = compiled.offsets[ctx + 1] - lo
+            entry = lo + (u[hit] * width).astype(np.int64)
+            out[rows[hit], pos[hit]] = compiled.successors[entry]
+            state[hit] = compiled.next_rows[entry]
+            pos[hit] += 1
+
+        # Dead-end rows restart from a random context, like generate_from_chain does
+        miss = active & (state < 0)
+        if miss.any():
+            restart = (u[miss] * n_contexts).astype(np.int64)
+            miss_rows = rows[miss]
+            for j in range(order):
+                out[miss_rows, pos[miss] + j] = compiled.contexts[restart, j]
+            state[miss] = restart
+            pos[miss] += order
+
+    return out[:, :length]
+
+# Function to generate one text per seed using the batched generator
+def generate_batch(compiled, seeds, length):
+    vocab = compiled.vocab
+    return [' '.join(vocab[i] for i in row) for row in generate_ids_batch(compiled, seeds, length).tolist()]
+
+# Function to generate many texts in fixed-size batches, yielding (seed, text) pairs in seed order
+def generate_many(compiled, seeds, length, batch_size=1024):
+    for i in range(0, len(seeds), batch_size):
+        batch_seeds = seeds[i:i + batch_size]
+        yield from zip(batch_seeds, generate_batch(compiled, batch_seeds, length))
+
+# Function to compare scalar and batched generation throughput in tokens/sec
+def benchmark(chain, n_books, length, base_seed=0, batch_size=1024):
+    seeds = list(range(base_seed, base_seed + n_books))
+
+    # generate_from_chain overshoots `length` when it restarts mid-book, while the batched path stops at
+    # exactly `length`, so only the first `length` words of each scalar book are counted
+    start_time = time.perf_counter()
+    scalar_tokens = 0
+    scalar_produced = 0
+    for seed in seeds:
+        n_words = len(generate_from_chain(chain, seed, length=length).split())
+        scalar_produced += n_words
+        scalar_tokens += min(n_words, length)
+    scalar_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    compiled = compile_chain(chain)
+    compile_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    batched_tokens = 0
+    for _, text in generate_many(compiled, seeds, length, batch_size=batch_size):
+        batched_tokens += len(text.split())
+    batched_time = time.perf_counter() - start_time
+
+    scalar_rate = scalar_tokens / scalar_time if scalar_time else float('inf')
+    batched_rate = batched_tokens / batched_time if batched_time else float('inf')
+    print(f"Scalar:  {scalar_tokens} tokens in {scalar_time:.2f}s ({scalar_rate:,.0f} tokens/sec; "
+          f"{scalar_produced / n_books:.1f} words/book produced, capped at {length})")
+    print(f"Batched: {batched_tokens} tokens in {batched_time:.2f}s ({batched_rate:,.0f} tokens/sec; "
+          f"{batched_tokens / n_books:.1f} words/book, compile {compile_time:.2f}s, batch size {batch_size})")
+    print(f"Speedup: {batched_rate / scalar_rate:.1f}x")
+    return {
+        'scalar_tokens_per_sec': scalar_rate,
+        'batched_tokens_per_sec': batched_rate,
+        'compile_seconds': compile_time,
+    }
+
+# Benchmark the batched path against generate_from_chain on a folder of training texts
+def main():
+    folder_path = sys.argv[1] if len(sys.argv) > 1 else input("Enter the path to the folder with text files: ")
+    n_books = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    book_length = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+
+    chain = build_sentence_markov_chain(load_texts(folder_path), order=4)
+    benchmark(chain, n_books, book_length)
+
+if __name__ == "__main__":
+    main()
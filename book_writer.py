@@ -0,0 +1,122 @@
+import json
+import os
+import queue
+import struct
+import threading
+
+INDEX_ENTRY = struct.Struct('<QQ')  # (byte offset, byte length) of one book in a shard
+
+# Function to turn a title into a file name that is safe on every platform
+def safe_file_name(title):
+    return "".join(c if c.isalnum() or c in (' ', '_', '-') else "_" for c in title)
+
+# Function to lay out a book the way save_book always has
+def format_book(text, title, author):
+    return f"Title: {title}\nAuthor: {author}\n\n{text}"
+
+# Output sink writing one text file per book into a folder
+class DirectorySink:
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    # Function to write one book to its own file
+    def write(self, text, title, author):
+        file_path = os.path.join(self.folder, f"{safe_file_name(title)}.txt")
+        with open(file_path, "w", encoding="utf-8") as file:
+            file.write(format_book(text, title, author))
+
+    def close(self):
+        pass
+
+# Output sink appending books to a single JSONL shard with a fixed-width offset index for random access
+class JsonlShardSink:
+    def __init__(self, path, buffer_size=1 << 20):
+        self.path = path
+        self.shard = open(path, 'ab', buffering=buffer_size)
+        self.index = open(index_path(path), 'ab', buffering=buffer_size)
+        self.offset = self.shard.tell()
+
+    # Function to append one book and record where it landed
+    def write(self, text, title, author):
+        line = json.dumps({'title': title, 'author': author, 'text': text}, ensure_ascii=False).encode('utf-8') + b'\n'
+        self.shard.write(line)
+        self.index.write(INDEX_ENTRY.pack(self.offset, len(line)))
+        self.offset += len(line)
+
+    def close(self):
+        self.shard.close()
+        self.index.close()
+
+# Function to name the index file that accompanies a shard
+def index_path(shard_path):
+    return shard_path + '.idx'
+
+# Function to count the books in a shard from its index
+def count_books(shard_path):
+    return os.path.getsize(index_path(shard_path)) // INDEX_ENTRY.size
+
+# Function to read the i-th book of a shard without scanning the books before it
+def read_book(shard_path, i):
+    with open(index_path(shard_path), 'rb') as index:
+        index.seek(i * INDEX_ENTRY.size)
+        entry = index.read(INDEX_ENTRY.size)
+    if len(entry) != INDEX_ENTRY.size:
+        raise IndexError(f"{shard_path} has no book {i}")
+    offset, length = INDEX_ENTRY.unpack(entry)
+    with open(shard_path, 'rb') as shard:
+        shard.seek(offset)
+        return json.loads(shard.read(length))
+
+# Writes books to a sink on a background thread so generation never waits on disk
+class BackgroundBookWriter:
+    def __init__(self, sink, max_pending=0):
+        self.sink = sink
+        self.pending = queue.Queue(maxsize=max_pending)  # 0 means unbounded
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name='book-writer', daemon=True)
+        self.thread.start()
+
+    # Function to drain the queue into the sink until close() is called
+    def run(self):
+        while True:
+            book = self.pending.get()
+            if book is None:
+                break
+            if self.error is None:
+                try:
+                    self.sink.write(*book)
+                except Exception as e:
+                    self.error = e
+        try:
+            self.sink.close()
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+
+    # Function to queue one book for writing, surfacing any earlier write failure
+    def write(self, text, title, author):
+        if self.error is not None:
+            raise self.error
+        self.pending.put((text, title, author))
+
+    # Function to flush every queued book and close the sink without raising
+    def drain(self):
+        self.pending.put(None)
+        self.thread.join()
+
+    # Function to flush every queued book, close the sink, and raise if any write failed
+    def close(self):
+        self.drain()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    # An exception from the with body takes precedence over any stored write error
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.drain()
+        else:
+            self.close()
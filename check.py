@@ -0,0 +1,132 @@
+import os
+import random
+import shutil
+import sys
+import tempfile
+from collections import Counter
+
+from gen import build_record_markov_chain, build_sentence_markov_chain, generate_from_record_chain, record_starts
+from model_io import load_compressed_model, save_compressed_model
+from train_budget import train_with_budget
+
+WORDS = ('the old man sea and of a in to was he it his that with for on night day ship whale '
+         'house great little woman time long away said came went down up river road light dark').split()
+
+# Function to write a small, reproducible training corpus. Files draw from a shared pool of sentences
+# so contexts repeat within and across files, and runs spilled at different times have to be summed
+def write_corpus(folder_path, n_files=4, n_sentences=400, pool_size=150, seed=0):
+    rng = random.Random(seed)
+    pool = []
+    for _ in range(pool_size):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(1, 12))]
+        pool.append(' '.join(words).capitalize() + rng.choice('.!?'))
+    os.makedirs(folder_path, exist_ok=True)
+    for i in range(n_files):
+        with open(os.path.join(folder_path, f"text_{i:02d}.txt"), 'w', encoding='utf-8') as file:
+            file.write(' '.join(rng.choice(pool) for _ in range(n_sentences)))
+
+# Function to make title-like records that share words, including records shorter than the chain order
+def make_records(n_records=300, seed=0):
+    rng = random.Random(seed)
+    return [' '.join(rng.choice(WORDS[:12]).title() for _ in range(rng.randint(1, 6))) for _ in range(n_records)]
+
+# Function to build a full model from the corpus folder and records, as gen.build_model does
+def build_check_model(folder_path, records):
+    text = ''
+    for file_name in sorted(os.listdir(folder_path)):
+        with open(os.path.join(folder_path, file_name), 'r', encoding='utf-8') as file:
+            text += file.read() + ' '
+    return {
+        'title_chain': build_record_markov_chain(records, order=2),
+        'title_starts': record_starts(records, order=2),
+        'sentence_chain': build_sentence_markov_chain(text, order=4),
+    }
+
+# Function to check that a compressed model reloads equal to the original, key and successor order included
+def check_compressed_round_trip(model, work_dir):
+    path = os.path.join(work_dir, 'model.mkvz')
+    save_compressed_model(model, path, block_size=16)
+    loaded = load_compressed_model(path)
+    if sorted(loaded) != sorted(model):
+        return f"sections differ: {sorted(loaded)} != {sorted(model)}"
+    for name, value in model.items():
+        expected = list(value.items()) if isinstance(value, dict) else value
+        actual = list(loaded[name].items()) if isinstance(value, dict) else loaded[name]
+        if actual != expected:
+            return f"{name} differs after the round trip"
+    return None
+
+# Function to check that record generation starts at a real record start and never crosses into another record
+def check_record_boundaries(records, order=2, n_seeds=2000):
+    chain = build_record_markov_chain(records, order=order)
+    starts = record_starts(records, order=order)
+    start_set = set(starts)
+    # Every order+1 words in a row of a generated record must occur together inside one record
+    windows = set()
+    for record in records:
+        words = record.split()
+        windows.update(tuple(words[i:i + order + 1]) for i in range(len(words) - order))
+    for seed in range(n_seeds):
+        length = 1 + seed % 8
+        words = generate_from_record_chain(chain, starts, seed, length=length).split()
+        if len(words) > length:
+            return f"seed {seed} produced {len(words)} words for length {length}"
+        if tuple(words[:order]) not in start_set and not any(start[:length] == tuple(words) for start in starts):
+            return f"seed {seed} does not begin at a record start: {' '.join(words)!r}"
+        for i in range(len(words) - order):
+            if tuple(words[i:i + order + 1]) not in windows:
+                return f"seed {seed} crosses a record boundary: {' '.join(words)!r}"
+    return None
+
+# Function to check that budgeted training with spilling counts exactly what build_sentence_markov_chain does
+def check_budget_training(folder_path, work_dir, order=4):
+    # train_with_budget reads one file at a time, so sentences never span two files
+    expected = Counter()
+    for file_name in sorted(os.listdir(folder_path)):
+        with open(os.path.join(folder_path, file_name), 'r', encoding='utf-8') as file:
+            chain = build_sentence_markov_chain(file.read(), order=order)
+        for state, next_words in chain.items():
+            expected.update((state, word) for word in next_words)
+
+    path = os.path.join(work_dir, 'budget.mkvz')
+    unbounded = train_with_budget(folder_path, path, order=order, progress=None)
+    # Leave room for about a tenth of the count table next to the vocabulary, forcing several spills
+    budget = unbounded['vocab_bytes'] + (unbounded['context_bytes'] + unbounded['successor_bytes']) // 10
+    spilled = train_with_budget(folder_path, path, order=order, memory_budget=budget, progress=None,
+                                max_fan_in=4)
+    if spilled['runs_spilled'] < 2:
+        return f"expected several spilled runs, got {spilled['runs_spilled']}"
+    actual = Counter()
+    for state, next_words in load_compressed_model(path)['sentence_chain'].items():
+        actual.update((state, word) for word in next_words)
+    if actual != expected:
+        return f"{len(actual - expected) + len(expected - actual)} (context, successor) counts differ"
+    if (spilled['contexts'], spilled['successors']) != (unbounded['contexts'], unbounded['successors']):
+        return f"spilled run reports {spilled['contexts']} contexts, unbounded run {unbounded['contexts']}"
+    return None
+
+# Run every check on a generated corpus and exit non-zero if any fails
+def main():
+    work_dir = tempfile.mkdtemp(prefix='markov_check_')
+    try:
+        folder_path = os.path.join(work_dir, 'train')
+        write_corpus(folder_path)
+        records = make_records()
+        model = build_check_model(folder_path, records)
+        checks = [
+            ('compressed model round trip', lambda: check_compressed_round_trip(model, work_dir)),
+            ('record generation stays within records', lambda: check_record_boundaries(records)),
+            ('budgeted training with spilling', lambda: check_budget_training(folder_path, work_dir)),
+        ]
+        failed = False
+        for name, check in checks:
+            error = check()
+            print(f"{'FAIL' if error else 'ok'}   {name}" + (f": {error}" if error else ''))
+            failed = failed or error is not None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,10 @@ import random
 import re
 import time
 import csv
+import pickle
+import sys
+
+from book_writer import BackgroundBookWriter, DirectorySink, JsonlShardSink, format_book, safe_file_name
 
 # Function to load text files from a folder
 def load_texts(folder_path):
@@ -13,23 +17,14 @@ def load_texts(folder_path):
                 text += file.read() + " "
     return text
 
+# Precompile regex patterns for faster execution
+non_alpha = re.compile(r'[^A-Za-z\s]')
+multi_space = re.compile(r'\s+')
+
 # Function to clean text (for titles and authors)
 def clean_text(text):
-    text = re.sub(r'[^A-Za-z\s]', '', text)  # Remove non-alphabetic characters
-    text = re.sub(r'\s+', ' ', text)  # Replace multiple spaces with a single space
-    return text.strip()
-
-# Function to build a word-based Markov Chain model (for titles and authors)
-def build_word_markov_chain(text, order=2):
-    words = text.split()
-    markov_chain = {}
-    for i in range(len(words) - order):
-        key = tuple(words[i:i + order])
-        next_word = words[i + order]
-        if key not in markov_chain:
-            markov_chain[key] = []
-        markov_chain[key].append(next_word)
-    return markov_chain
+    text = non_alpha.sub('', text)  # Remove non-alphabetic characters
+    return multi_space.sub(' ', text).strip()  # Replace multiple spaces with a single space
 
 # Function to build a sentence-based Markov Chain model (for content)
 def build_sentence_markov_chain(text, order=3):
@@ -45,19 +40,38 @@ def build_sentence_markov_chain(text, order=3):
             markov_chain[key].append(next_word)
     return markov_chain
 
-# Function to load titles and authors from CSV file and clean them
-def load_titles_and_authors(csv_file):
-    titles = []
-    authors = []
+# Function to build a word-based Markov Chain from separate records, never linking one record to the next
+def build_record_markov_chain(records, order=2):
+    markov_chain = {}
+    for record in records:
+        words = record.split()
+        for i in range(len(words) - order):
+            key = tuple(words[i:i + order])
+            if key not in markov_chain:
+                markov_chain[key] = []
+            markov_chain[key].append(words[i + order])
+    return markov_chain
+
+# Function to collect the opening words of every record; records shorter than `order` are kept whole
+def record_starts(records, order=2):
+    starts = []
+    for record in records:
+        words = record.split()
+        if words:
+            starts.append(tuple(words[:order]))
+    return starts
+
+# Function to load (title, author) records from CSV file and clean them
+def load_title_and_author_records(csv_file):
+    records = []
     with open(csv_file, 'r', encoding='utf-8') as file:
         reader = csv.reader(file)
         next(reader)  # Skip header
         for row in reader:
             title, author = clean_text(row[1]), clean_text(row[2])
             if title != "Unknown Title" and author != "Unknown Author":
-                titles.append(title)
-                authors.append(author)
-    return ' '.join(titles), ' '.join(authors)
+                records.append((title, author))
+    return records
 
 # Function to generate text based on Markov Chain model
 def generate_from_chain(chain, seed, length=5):
@@ -82,60 +96,124 @@ def generate_from_chain(chain, seed, length=5):
 
     return ' '.join(generated_words)
 
+# Function to generate text from a record chain, starting at a real record start and stopping at a record end
+def generate_from_record_chain(chain, starts, seed, length=5):
+    random.seed(seed)
+    if not starts:
+        return ''
+
+    generated_words = list(random.choice(starts))
+    order = len(next(iter(chain))) if chain else len(generated_words)
+    while len(generated_words) < length:
+        next_word_options = chain.get(tuple(generated_words[-order:]))
+        if not next_word_options:
+            break
+        generated_words.append(random.choice(next_word_options))
+
+    return ' '.join(generated_words[:length])
+
 # Function to save generated book with title and author
 def save_book(text, folder, title, author):
-    safe_title = "".join(c if c.isalnum() or c in (' ', '_', '-') else "_" for c in title)
-    file_path = os.path.join(folder, f"{safe_title}.txt")
+    file_path = os.path.join(folder, f"{safe_file_name(title)}.txt")
     
     with open(file_path, "w", encoding="utf-8") as file:
-        file.write(f"Title: {title}\n")
-        file.write(f"Author: {author}\n\n")
-        file.write(text)
+        file.write(format_book(text, title, author))
+
+# Function to build the title and author chains, with their record starts, from the CSV
+def build_record_model(csv_file):
+    records = load_title_and_author_records(csv_file)
+    titles = [title for title, _ in records]
+    authors = [author for _, author in records]
+    return {
+        'title_chain': build_record_markov_chain(titles, order=2),
+        'title_starts': record_starts(titles, order=2),
+        'author_chain': build_record_markov_chain(authors, order=2),
+        'author_starts': record_starts(authors, order=2),
+    }
+
+# Function to build every chain needed to generate a book; pruning options (min_context_count,
+# min_successor_count, top_k) are passed to prune.build_pruned_sentence_markov_chain
+def build_model(csv_file, folder_path, **pruning):
+    model = build_record_model(csv_file)
+    text = load_texts(folder_path)
+    if pruning:
+        from prune import build_pruned_sentence_markov_chain  # prune imports gen, so load it on first use
+        model['sentence_chain'] = build_pruned_sentence_markov_chain(text, order=4, **pruning)
+    else:
+        model['sentence_chain'] = build_sentence_markov_chain(text, order=4)
+    return model
+
+# Everything generate_books needs from a model
+REQUIRED_MODEL_KEYS = ('title_chain', 'title_starts', 'author_chain', 'author_starts', 'sentence_chain')
+
+# Function to stop with a clear message when a model lacks chains generate_books needs
+def require_full_model(model, model_path):
+    missing = [name for name in REQUIRED_MODEL_KEYS if name not in model]
+    if missing:
+        sys.exit(f"{model_path} is missing {', '.join(missing)}; rebuild it with gen.build_model")
+
+# Function to persist a trained model so later runs can skip retraining
+def save_model(model, model_path):
+    with open(model_path, 'wb') as file:
+        pickle.dump(model, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+# Function to load a model written by save_model
+def load_model(model_path):
+    with open(model_path, 'rb') as file:
+        return pickle.load(file)
+
+# Function to create a timestamped output folder or JSONL shard, returning (sink, path)
+def open_book_sink(output_format="folder"):
+    output_path = time.strftime("%Y%m%d_%H%M%S_generated_books")
+    if output_format == "jsonl":
+        output_path += ".jsonl"
+        return JsonlShardSink(output_path), output_path
+    return DirectorySink(output_path), output_path
+
+# Function to generate n books with consecutive seeds and hand them to a writer
+def generate_books(model, writer, n_books, book_length, base_seed):
+    for i in range(n_books):
+        current_seed = base_seed + i  # Unique seed for each book
+
+        # Generate the title and author using the record-aware word-level Markov Chains
+        book_title = generate_from_record_chain(model['title_chain'], model['title_starts'], current_seed, length=5)
+        author = generate_from_record_chain(model['author_chain'], model['author_starts'], current_seed, length=2)
+
+        # Generate the content using the sentence-level Markov Chain
+        generated_text = generate_from_chain(model['sentence_chain'], current_seed, length=book_length)
+
+        if generated_text:
+            writer.write(generated_text, book_title, author)
+            print(f"Generated: {book_title} by {author} (Seed: {current_seed})")
+        else:
+            print(f"Failed to generate text for {book_title}")
 
 # Main program
 def main():
-    # Step 1: Load the CSV containing titles and authors
-    csv_file = 'extracted_titles_and_authors.csv'
-    titles_text, authors_text = load_titles_and_authors(csv_file)
-    
-    # Step 2: Build word-level Markov Chains for titles and authors
-    title_chain = build_word_markov_chain(titles_text, order=2)
-    author_chain = build_word_markov_chain(authors_text, order=2)
-    
-    # Step 3: Load text files from a folder (for content generation)
-    folder_path = input("Enter the path to the folder with text files: ")
-    loaded_text = load_texts(folder_path)
-    
-    # Step 4: Build the sentence-level Markov Chain model for the content
-    sentence_markov_chain = build_sentence_markov_chain(loaded_text, order=4)
+    # Steps 1-4: Load a saved model, or build the title/author chains from the CSV and the content chain from the text folder
+    model_path = input("Enter the path to a saved model (leave blank to train a new one): ").strip()
+    if model_path:
+        model = load_model(model_path)
+        require_full_model(model, model_path)
+    else:
+        csv_file = 'extracted_titles_and_authors.csv'
+        folder_path = input("Enter the path to the folder with text files: ")
+        model = build_model(csv_file, folder_path)
     
     # Step 5: Ask for the number of books to generate, their length, and the initial random seed
     n_books = int(input("Enter the number of books to generate: "))
     book_length = int(input("Enter the length of each generated book (in words): "))
     base_seed = int(input("Enter a base random seed: "))
     
-    # Step 6: Create a timestamped folder for the new books
-    output_folder = time.strftime("%Y%m%d_%H%M%S_generated_books")
-    os.makedirs(output_folder, exist_ok=True)
+    # Step 6: Create a timestamped folder (or a single JSONL shard) for the new books, written in the background
+    output_format = input("Enter the output format, folder or jsonl (default folder): ").strip().lower() or "folder"
+    sink, output_folder = open_book_sink(output_format)
 
     # Step 7: Generate new books with different seeds per book
-    for i in range(n_books):
-        current_seed = base_seed + i  # Unique seed for each book
-        
-        # Generate the title and author using the word-level Markov Chains
-        book_title = generate_from_chain(title_chain, current_seed, length=5)
-        author = generate_from_chain(author_chain, current_seed, length=2)
-        
-        # Generate the content using the sentence-level Markov Chain
-        generated_text = generate_from_chain(sentence_markov_chain, current_seed, length=book_length)
-        
-        if generated_text:
-            save_book(generated_text, output_folder, book_title, author)
-            print(f"Generated: {book_title} by {author} (Seed: {current_seed})")
-        else:
-            print(f"Failed to generate text for {book_title}")
+    with BackgroundBookWriter(sink) as writer:
+        generate_books(model, writer, n_books, book_length, base_seed)
 
-    print(f"All generated books saved in folder: {output_folder}")
+    print(f"All generated books saved in: {output_folder}")
 
 if __name__ == "__main__":
     main()
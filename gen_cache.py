@@ -0,0 +1,163 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from gen import generate_from_chain
+
+# Function to fingerprint a chain (and its record starts, if any) so cache entries can never outlive the model that produced them.
+# Keys are hashed in iteration order because generate_from_chain picks its start from list(chain.keys())
+def model_hash(chain, starts=None):
+    digest = hashlib.sha256()
+    for state, next_words in chain.items():
+        digest.update('\x1f'.join(state).encode('utf-8'))
+        digest.update(b'\x1e')
+        digest.update('\x1f'.join(next_words).encode('utf-8'))
+        digest.update(b'\x1d')
+    # Record chains also depend on the start list generate_from_record_chain samples from
+    for start in starts or ():
+        digest.update(b'\x1c')
+        digest.update('\x1f'.join(start).encode('utf-8'))
+    return digest.hexdigest()
+
+# Function to build the content-addressed key for one generation request
+def cache_key(model_digest, chain_kind, seed, length):
+    return hashlib.sha256(f"{model_digest}:{chain_kind}:{seed}:{length}".encode('utf-8')).hexdigest()
+
+# Two-tier cache of generated text: a bounded in-memory LRU backed by an optional size-capped directory.
+# Once the directory passes max_disk_bytes it is trimmed back to disk_low_water of the cap
+class GenerationCache:
+    def __init__(self, max_entries=10000, disk_dir=None, max_disk_bytes=1 << 30, disk_low_water=0.9):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_low_water_bytes = int(max_disk_bytes * disk_low_water)
+        self.memory = OrderedDict()
+        self.disk_index = OrderedDict()  # path -> size, least recently used first
+        self.lock = threading.Lock()
+        self.metrics = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'memory_evictions': 0, 'disk_evictions': 0}
+        self.disk_bytes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            # The directory is scanned once; afterwards the index is kept up to date in memory
+            for _, path, size in sorted(self.disk_entries()):
+                self.disk_index[path] = size
+                self.disk_bytes += size
+
+    # Function to map a key onto its file in the disk tier
+    def disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.txt")
+
+    # Function to list (mtime, path, size) for every file in the disk tier, used once at startup
+    def disk_entries(self):
+        entries = []
+        for root, _, file_names in os.walk(self.disk_dir):
+            for file_name in file_names:
+                if file_name.endswith('.txt'):
+                    path = os.path.join(root, file_name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    # Function to look a key up in memory, then on disk; returns None on a miss
+    def get(self, key):
+        text = self.get_from_memory(key)
+        if text is None:
+            text = self.get_from_disk(key)
+        return text
+
+    # Function to look a key up in the memory tier only; a miss here is not counted until the disk tier misses too
+    def get_from_memory(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.metrics['memory_hits'] += 1
+                return self.memory[key]
+        return None
+
+    # Function to look a key up in the disk tier, which blocks on file I/O; returns None on a miss
+    def get_from_disk(self, key):
+        if self.disk_dir:
+            path = self.disk_path(key)
+            try:
+                with open(path, 'r', encoding='utf-8') as file:
+                    text = file.read()
+            except FileNotFoundError:
+                with self.lock:
+                    self.disk_bytes -= self.disk_index.pop(path, 0)
+            else:
+                with self.lock:
+                    if path in self.disk_index:
+                        self.disk_index.move_to_end(path)
+                    self.metrics['disk_hits'] += 1
+                    self.remember(key, text)
+                return text
+
+        with self.lock:
+            self.metrics['misses'] += 1
+        return None
+
+    # Function to store a generated text in both tiers
+    def put(self, key, text):
+        self.put_in_memory(key, text)
+        if self.disk_dir:
+            self.write_to_disk(key, text)
+
+    # Function to store a generated text in the memory tier only
+    def put_in_memory(self, key, text):
+        with self.lock:
+            self.remember(key, text)
+
+    # Function to insert into the memory tier, evicting the least recently used entry (lock held).
+    # With max_entries 0 the memory tier is off, so nothing is inserted only to be evicted again
+    def remember(self, key, text):
+        if self.max_entries <= 0:
+            return
+        self.memory[key] = text
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.metrics['memory_evictions'] += 1
+
+    # Function to write one entry to disk and evict the least recently used files once over the size cap
+    def write_to_disk(self, key, text):
+        path = self.disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = text.encode('utf-8')
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)  # Atomic so concurrent readers never see a partial file
+
+        with self.lock:
+            self.disk_bytes += len(data) - self.disk_index.pop(path, 0)
+            self.disk_index[path] = len(data)
+            if self.disk_bytes <= self.max_disk_bytes:
+                return
+            while self.disk_index and self.disk_bytes > self.disk_low_water_bytes:
+                old_path, size = self.disk_index.popitem(last=False)
+                self.disk_bytes -= size
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    continue
+                self.metrics['disk_evictions'] += 1
+
+    # Function to report hit/miss counters and the hit rate
+    def stats(self):
+        with self.lock:
+            stats = dict(self.metrics)
+            stats['memory_entries'] = len(self.memory)
+            stats['disk_bytes'] = self.disk_bytes
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+# Function to generate from a chain through the cache, skipping generation entirely on a hit
+def cached_generate(cache, chain, model_digest, chain_kind, seed, length=5, generate=generate_from_chain):
+    key = cache_key(model_digest, chain_kind, seed, length)
+    text = cache.get(key)
+    if text is None:
+        text = generate(chain, seed, length=length)
+        cache.put(key, text)
+    return text
@@ -0,0 +1,262 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import defaultdict, deque
+
+from gen import build_model, save_model, generate_from_record_chain, require_full_model
+from model_io import load_any_model
+from batch_gen import compile_chain, generate_batch
+from gen_cache import GenerationCache, cache_key, model_hash
+
+# Request kinds and the model chain each one samples from
+CHAIN_KINDS = {
+    'title': 'title_chain',
+    'author': 'author_chain',
+    'content': 'sentence_chain',
+}
+
+# Metadata kinds are sampled from real record starts and are cheap enough to serve without batching
+RECORD_STARTS = {
+    'title': 'title_starts',
+    'author': 'author_starts',
+}
+
+MAX_LENGTH = 100000
+
+# Function to compute a percentile from a sorted list of samples
+def percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(pct / 100 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+# Warm generation service: holds compiled chains in memory and coalesces requests into micro-batches
+class GenerationServer:
+    def __init__(self, model, batch_window=0.005, max_batch=256, latency_window=10000, cache=None):
+        self.model = model
+        self.compiled = {
+            kind: compile_chain(model[key]) for kind, key in CHAIN_KINDS.items() if kind not in RECORD_STARTS
+        }
+        self.cache = cache
+        # Hashing the full sentence chain is only worth its startup cost when results are cached
+        self.model_digests = {}
+        if cache is not None:
+            self.model_digests = {
+                kind: model_hash(model[key], model.get(RECORD_STARTS.get(kind)))
+                for kind, key in CHAIN_KINDS.items()
+            }
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.queue = None
+        self.latencies = deque(maxlen=latency_window)
+        self.batch_sizes = deque(maxlen=latency_window)
+        self.requests_served = 0
+
+    # Function to answer from the cache, the record chains, or by queueing for a content batch
+    async def generate(self, kind, seed, length):
+        loop = asyncio.get_running_loop()
+        # Batched output differs from generate_from_chain for the same seed, so it gets its own kind
+        if self.cache is not None:
+            cache_kind = kind if kind in RECORD_STARTS else f"batched-{kind}"
+            key = cache_key(self.model_digests[kind], cache_kind, seed, length)
+            # The disk tier blocks on file I/O, so it runs off the event loop like batch generation does
+            text = self.cache.get_from_memory(key)
+            if text is None and self.cache.disk_dir:
+                text = await loop.run_in_executor(None, self.cache.get_from_disk, key)
+            elif text is None:
+                text = self.cache.get_from_disk(key)  # Only counts the miss
+            if text is not None:
+                return text
+        if kind in RECORD_STARTS:
+            chain, starts = self.model[CHAIN_KINDS[kind]], self.model[RECORD_STARTS[kind]]
+            text = generate_from_record_chain(chain, starts, seed, length=length)
+        else:
+            future = loop.create_future()
+            await self.queue.put((kind, seed, length, future))
+            text = await future
+        if self.cache is not None:
+            self.cache.put_in_memory(key, text)
+            if self.cache.disk_dir:
+                await loop.run_in_executor(None, self.cache.write_to_disk, key, text)
+        return text
+
+    # Function to drain the queue into micro-batches and run each batch off the event loop
+    async def batch_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(pending) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.batch_sizes.append(len(pending))
+
+            # Requests only share a lockstep batch when they sample the same chain to the same length
+            groups = defaultdict(list)
+            for kind, seed, length, future in pending:
+                groups[(kind, length)].append((seed, future))
+            for (kind, length), items in groups.items():
+                seeds = [seed for seed, _ in items]
+                try:
+                    texts = await loop.run_in_executor(None, generate_batch, self.compiled[kind], seeds, length)
+                except Exception:
+                    # Retry each request on its own so one bad request only fails itself
+                    await self.generate_each(kind, length, items)
+                    continue
+                for (_, future), text in zip(items, texts):
+                    if not future.done():
+                        future.set_result(text)
+
+    # Function to generate a failed batch one request at a time, failing only the requests that raise
+    async def generate_each(self, kind, length, items):
+        loop = asyncio.get_running_loop()
+        for seed, future in items:
+            try:
+                texts = await loop.run_in_executor(None, generate_batch, self.compiled[kind], [seed], length)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            if not future.done():
+                future.set_result(texts[0])
+
+    # Function to summarize recent latencies in milliseconds
+    def stats(self):
+        samples = sorted(self.latencies)
+        batch_sizes = list(self.batch_sizes)
+        stats = {
+            'requests_served': self.requests_served,
+            'p50_ms': percentile(samples, 50) * 1000,
+            'p90_ms': percentile(samples, 90) * 1000,
+            'p99_ms': percentile(samples, 99) * 1000,
+            'max_ms': (samples[-1] if samples else 0.0) * 1000,
+            'mean_batch_size': sum(batch_sizes) / len(batch_sizes) if batch_sizes else 0.0,
+        }
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        return stats
+
+    # Function to handle one HTTP/1.1 request per connection
+    async def handle_connection(self, reader, writer):
+        start_time = time.perf_counter()
+        try:
+            status, payload = await self.handle_request(reader)
+        except (ValueError, KeyError, TypeError) as e:
+            status, payload = 400, {'error': str(e)}
+        except Exception as e:
+            status, payload = 500, {'error': str(e)}
+        body = json.dumps(payload).encode('utf-8')
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}[status]
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode('ascii') + body
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+        if status == 200 and payload.get('text') is not None:
+            self.latencies.append(time.perf_counter() - start_time)
+            self.requests_served += 1
+
+    # Function to parse a request and dispatch it to /generate or /stats
+    async def handle_request(self, reader):
+        request_line = (await reader.readline()).decode('ascii').split()
+        if len(request_line) < 2:
+            raise ValueError("Malformed request line")
+        method, path = request_line[0], request_line[1]
+        content_length = 0
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'content-length':
+                content_length = int(value)
+
+        if method == 'GET' and path == '/stats':
+            return 200, self.stats()
+        if method == 'POST' and path == '/generate':
+            request = json.loads(await reader.readexactly(content_length)) if content_length else {}
+            kind = request.get('kind', 'content')
+            if kind not in CHAIN_KINDS:
+                raise ValueError(f"Unknown kind {kind!r}, expected one of {sorted(CHAIN_KINDS)}")
+            seed = int(request['seed'])
+            length = int(request.get('length', 500))
+            if not 0 < length <= MAX_LENGTH:
+                raise ValueError(f"length must be between 1 and {MAX_LENGTH}")
+            return 200, {'text': await self.generate(kind, seed, length)}
+        return 404, {'error': f"No route for {method} {path}"}
+
+    # Function to serve forever on a TCP port or a Unix socket
+    async def serve(self, host='127.0.0.1', port=8765, unix_path=None):
+        self.queue = asyncio.Queue()
+        worker = asyncio.create_task(self.batch_worker())
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_path)
+            print(f"Serving on unix:{unix_path}")
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            print(f"Serving on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            worker.cancel()
+
+# Main program
+def main():
+    parser = argparse.ArgumentParser(description="Serve Markov book generation from a warm, persisted model.")
+    parser.add_argument('model', help="Model written by gen.save_model or model_io.save_compressed_model")
+    parser.add_argument('--train', metavar='FOLDER', help="Train and save the model from this text folder if it does not exist")
+    parser.add_argument('--csv', default='extracted_titles_and_authors.csv', help="Titles and authors CSV used with --train")
+    parser.add_argument('--min-context-count', type=int, default=1, help="With --train, drop contexts seen fewer times")
+    parser.add_argument('--min-successor-count', type=int, default=1, help="With --train, drop rarer successors")
+    parser.add_argument('--top-k', type=int, help="With --train, keep only the k most frequent successors per context")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', metavar='PATH', help="Listen on a Unix socket instead of TCP")
+    parser.add_argument('--batch-window-ms', type=float, default=5.0)
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--cache-entries', type=int, default=0, help="Size of the in-memory result cache (0 disables caching)")
+    parser.add_argument('--cache-dir', help="Directory for the on-disk result cache tier")
+    parser.add_argument('--cache-disk-mb', type=int, default=1024)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        if not args.train:
+            parser.error(f"{args.model} does not exist; pass --train FOLDER to build it")
+        pruning = {}
+        if args.min_context_count > 1:
+            pruning['min_context_count'] = args.min_context_count
+        if args.min_successor_count > 1:
+            pruning['min_successor_count'] = args.min_successor_count
+        if args.top_k is not None:
+            pruning['top_k'] = args.top_k
+        save_model(build_model(args.csv, args.train, **pruning), args.model)
+        print(f"Saved model to {args.model}")
+
+    cache = None
+    if args.cache_entries or args.cache_dir:
+        cache = GenerationCache(max_entries=args.cache_entries, disk_dir=args.cache_dir,
+                                max_disk_bytes=args.cache_disk_mb * 1024 * 1024)
+    model = load_any_model(args.model)
+    require_full_model(model, args.model)
+    server = GenerationServer(model, batch_window=args.batch_window_ms / 1000,
+                              max_batch=args.max_batch, cache=cache)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import argparse
+
+from gen import open_book_sink, generate_books, require_full_model
+from book_writer import BackgroundBookWriter
+from model_io import load_any_model
+
+# Generation-only entry point: loads a saved model and writes books, importing nothing beyond the stdlib
+def main():
+    parser = argparse.ArgumentParser(description="Generate books from a saved Markov model.")
+    parser.add_argument('model', help="Model written by gen.save_model or model_io.save_compressed_model")
+    parser.add_argument('n_books', type=int)
+    parser.add_argument('length', type=int, help="Length of each book in words")
+    parser.add_argument('--seed', type=int, default=0, help="Base random seed")
+    parser.add_argument('--format', choices=['folder', 'jsonl'], default='folder')
+    args = parser.parse_args()
+
+    model = load_any_model(args.model)
+    require_full_model(model, args.model)
+
+    sink, output_path = open_book_sink(args.format)
+    with BackgroundBookWriter(sink) as writer:
+        generate_books(model, writer, args.n_books, args.length, args.seed)
+    print(f"All generated books saved in: {output_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import subprocess
+import sys
+
+# Modules that must never be pulled in by the generation path
+HEAVY_MODULES = ('numpy', 'matplotlib', 'seaborn', 'plotly', 'networkx', 'scipy', 'requests', 'bs4')
+
+# Function to run `python -X importtime` on an import statement, returning {module: self time in us}
+def import_times(statement):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|', 2)
+        times[name.strip()] = int(self_us)
+    return times
+
+# Function to measure what importing `module` adds on top of bare interpreter startup
+def measure_import(module):
+    baseline = import_times('pass')
+    times = import_times(f'import {module}')
+    return {name: us for name, us in times.items() if name not in baseline}
+
+# Function to check an entry point's import cost against a budget in milliseconds
+def check_import_budget(module='generate', budget_ms=50.0, top=10):
+    added = measure_import(module)
+    total_ms = sum(added.values()) / 1000
+    heavy = sorted({name.split('.')[0] for name in added} & set(HEAVY_MODULES))
+
+    print(f"import {module}: {len(added)} modules, {total_ms:.1f} ms (budget {budget_ms:.1f} ms)")
+    for name, us in sorted(added.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {us / 1000:8.2f} ms  {name}")
+    if heavy:
+        print(f"Heavy dependencies imported: {', '.join(heavy)}")
+    return total_ms <= budget_ms and not heavy
+
+# Exit non-zero when the generation entry point exceeds its import-time budget
+def main():
+    module = sys.argv[1] if len(sys.argv) > 1 else 'generate'
+    budget_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 50.0
+    if not check_import_budget(module, budget_ms):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import json
+import time
+
+from gen_server import percentile
+
+# Function to send one HTTP request to the generation server and return the decoded JSON body
+async def http_request(host, port, method, path, payload=None, unix_path=None):
+    if unix_path:
+        reader, writer = await asyncio.open_unix_connection(unix_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\n"
+        f"Host: {host}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: close\r\n\r\n".encode('ascii') + body
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    status = int(head.split(None, 2)[1])
+    if status != 200:
+        raise RuntimeError(f"{method} {path} failed with {status}: {body.decode('utf-8', 'replace')}")
+    return json.loads(body)
+
+# Function to fire `n_requests` generate calls with at most `concurrency` in flight
+async def run_load(host, port, n_requests, concurrency, kind, length, base_seed, unix_path=None):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(seed):
+        nonlocal errors
+        async with semaphore:
+            start_time = time.perf_counter()
+            try:
+                await http_request(host, port, 'POST', '/generate',
+                                   {'kind': kind, 'seed': seed, 'length': length}, unix_path)
+            except (OSError, RuntimeError):
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(one(base_seed + i) for i in range(n_requests)))
+    elapsed = time.perf_counter() - start_time
+
+    samples = sorted(latencies)
+    print(f"{len(samples)} requests ({errors} errors) in {elapsed:.2f}s, "
+          f"{len(samples) / elapsed:,.0f} req/s at concurrency {concurrency}")
+    print(f"Client latency: p50 {percentile(samples, 50) * 1000:.1f} ms, "
+          f"p90 {percentile(samples, 90) * 1000:.1f} ms, p99 {percentile(samples, 99) * 1000:.1f} ms")
+    print(f"Server stats: {await http_request(host, port, 'GET', '/stats', unix_path=unix_path)}")
+
+# Main program
+def main():
+    parser = argparse.ArgumentParser(description="Load-test a running gen_server.py instance.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', metavar='PATH')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--kind', default='content', choices=['title', 'author', 'content'])
+    parser.add_argument('--length', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    asyncio.run(run_load(args.host, args.port, args.requests, args.concurrency,
+                         args.kind, args.length, args.seed, args.unix))
+
+if __name__ == "__main__":
+    main()
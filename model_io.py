@@ -0,0 +1,440 @@
+import bisect
+import gc
+import json
+import os
+import pickle
+import struct
+import sys
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+from itertools import accumulate, chain as iter_chain, repeat
+
+from gen import load_model
+
+MAGIC = b'MKVZ\x02'
+TRAILER = struct.Struct('<Q')
+LENGTH = struct.Struct('<I')
+SECTION_HEADER = struct.Struct('<II')  # (order, vocabulary size)
+BLOCK_HEADER = struct.Struct('<II')  # (contexts, successor runs)
+
+# Fixed-width unsigned array type codes; every array is stored little-endian
+U32 = next(code for code in 'IL' if array(code).itemsize == 4)
+U64 = next(code for code in 'LQ' if array(code).itemsize == 8)
+
+# Function to serialize an array in little-endian byte order
+def array_bytes(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+# Function to bulk-decode `count` little-endian values starting at `pos`, returning (array, next position)
+def read_array(payload, typecode, count, pos):
+    values = array(typecode)
+    end = pos + count * values.itemsize
+    values.frombytes(payload[pos:end])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values, end
+
+# Function to write a length prefix followed by a zlib-compressed payload
+def write_compressed(file, payload, level):
+    data = zlib.compress(payload, level)
+    file.write(LENGTH.pack(len(data)))
+    file.write(data)
+    return LENGTH.size + len(data)
+
+# Function to run-length encode a successor list, keeping its original order: [a, a, b, a] -> [(a, 2), (b, 1), (a, 1)]
+def successor_runs(next_words):
+    runs = []
+    for word in next_words:
+        if runs and runs[-1][0] == word:
+            runs[-1][1] += 1
+        else:
+            runs.append([word, 1])
+    return [tuple(run) for run in runs]
+
+# Function to list a chain's contexts in sorted order as (context, successor runs, insertion rank).
+# The rank and the run order let a reloaded chain reproduce generate_from_chain output exactly
+def chain_items(chain):
+    ranks = {state: rank for rank, state in enumerate(chain)}
+    for state in sorted(chain):
+        yield state, successor_runs(chain[state]), ranks[state]
+
+# Function to collect the sorted vocabulary of a chain
+def chain_vocab(chain):
+    words = set()
+    for state, next_words in chain.items():
+        words.update(state)
+        words.update(next_words)
+    return sorted(words)
+
+# Streaming writer for one chain section. Word ids follow sorted word order, so contexts sorted as
+# word tuples are sorted as id tuples too. Each block stores fixed-width uint32 columns: the first
+# context word delta-encoded, the remaining context words, runs per context, insertion ranks, then
+# the (word id, count) successor runs, so a reader can bulk-decode it with array.frombytes
+class ChainWriter:
+    def __init__(self, file, vocab, order, block_size=256, level=6):
+        self.file = file
+        self.order = order
+        self.block_size = block_size
+        self.level = level
+        self.word_ids = {word: i for i, word in enumerate(vocab)}
+        self.section_offset = file.tell()
+        self.index = []
+        self.n_added = 0
+        self.previous_ids = None
+        self.new_block()
+
+        file.write(SECTION_HEADER.pack(order, len(vocab)))
+        write_compressed(file, '\n'.join(vocab).encode('utf-8'), level)
+
+    # Function to reset the column buffers for the next block
+    def new_block(self):
+        self.columns = [array(U32) for _ in range(self.order)]
+        self.run_counts = array(U32)
+        self.ranks = array(U32)
+        self.run_ids = array(U32)
+        self.run_lengths = array(U32)
+
+    # Function to append one context; contexts must arrive in strictly increasing sorted order.
+    # `successors` are (word, count) runs and `rank` is the context's original insertion position
+    def add(self, state, successors, rank=None):
+        if len(state) != self.order:
+            raise ValueError(f"Context {state!r} does not have order {self.order}")
+        ids = tuple(self.word_ids[word] for word in state)
+        if self.previous_ids is not None and ids <= self.previous_ids:
+            raise ValueError(f"Context {state!r} is out of sorted order")
+        self.previous_ids = ids
+
+        for column, word_id in zip(self.columns, ids):
+            column.append(word_id)
+        self.run_counts.append(len(successors))
+        self.ranks.append(self.n_added if rank is None else rank)
+        for word, count in successors:
+            self.run_ids.append(self.word_ids[word])
+            self.run_lengths.append(count)
+        self.n_added += 1
+        if len(self.ranks) >= self.block_size:
+            self.flush_block()
+
+    # Function to compress the pending block and record it in the block index
+    def flush_block(self):
+        n_contexts = len(self.ranks)
+        if not n_contexts:
+            return
+        first_ids = [column[0] for column in self.columns]
+        first = self.columns[0]
+        deltas = array(U32, [first[0]])
+        deltas.extend(first[i] - first[i - 1] for i in range(1, n_contexts))
+
+        parts = [BLOCK_HEADER.pack(n_contexts, len(self.run_ids)), array_bytes(deltas)]
+        parts.extend(array_bytes(column) for column in self.columns[1:])
+        parts.extend(array_bytes(values) for values in (self.run_counts, self.ranks, self.run_ids, self.run_lengths))
+        offset = self.file.tell()
+        length = write_compressed(self.file, b''.join(parts), self.level)
+        self.index.append((offset, length, n_contexts, first_ids))
+        self.new_block()
+
+    # Function to finish the section, returning (section offset, index offset)
+    def close(self):
+        self.flush_block()
+        index_offset = self.file.tell()
+        offsets = array(U64, [entry[0] for entry in self.index])
+        lengths = array(U32, [entry[1] for entry in self.index])
+        counts = array(U32, [entry[2] for entry in self.index])
+        first_ids = array(U32, [word_id for entry in self.index for word_id in entry[3]])
+        payload = LENGTH.pack(len(self.index)) + b''.join(
+            array_bytes(values) for values in (offsets, lengths, counts, first_ids))
+        write_compressed(self.file, payload, self.level)
+        return self.section_offset, index_offset
+
+# Function to write a model section by section, passing each name's ChainWriter to `fill`.
+# `starts` holds small per-record start lists, which are stored in the trailer
+def write_model_sections(path, sections, starts=None, block_size=256, level=6):
+    table = {}
+    with open(path, 'wb') as file:
+        file.write(MAGIC)
+        for name, vocab, order, fill in sections:
+            writer = ChainWriter(file, vocab, order, block_size=block_size, level=level)
+            fill(writer)
+            table[name] = writer.close()
+        trailer_offset = file.tell()
+        trailer = {'chains': table, 'starts': starts or {}}
+        file.write(zlib.compress(json.dumps(trailer).encode('utf-8')))
+        file.write(TRAILER.pack(trailer_offset))
+        file.write(MAGIC)
+
+# Function to save a model in the compressed block format; dict entries are chains, list entries record starts
+def save_compressed_model(model, path, block_size=256, level=6):
+    sections = []
+    starts = {}
+    for name, chain in model.items():
+        if isinstance(chain, list):
+            starts[name] = chain
+            continue
+        if not chain:
+            raise ValueError(f"Cannot serialize empty chain {name!r}")
+
+        def fill(writer, chain=chain):
+            for state, successors, rank in chain_items(chain):
+                writer.add(state, successors, rank)
+
+        sections.append((name, chain_vocab(chain), len(next(iter(chain))), fill))
+    write_model_sections(path, sections, starts=starts, block_size=block_size, level=level)
+
+# Random-access reader for one chain section; decompresses only the block holding a context
+class CompressedChainReader:
+    def __init__(self, path, section_offset, index_offset, cached_blocks=16):
+        self.file = file = open(path, 'rb')
+        file.seek(section_offset)
+        self.order, n_words = SECTION_HEADER.unpack(file.read(SECTION_HEADER.size))
+        vocab_text = self.read_compressed().decode('utf-8')
+        self.vocab = vocab_text.split('\n') if n_words else []
+        self.word_ids = {word: i for i, word in enumerate(self.vocab)}
+
+        file.seek(index_offset)
+        payload = self.read_compressed()
+        n_blocks, = LENGTH.unpack_from(payload, 0)
+        pos = LENGTH.size
+        self.block_offsets, pos = read_array(payload, U64, n_blocks, pos)
+        _, pos = read_array(payload, U32, n_blocks, pos)
+        self.block_counts, pos = read_array(payload, U32, n_blocks, pos)
+        first_ids, pos = read_array(payload, U32, n_blocks * self.order, pos)
+        self.first_keys = [tuple(first_ids[i:i + self.order]) for i in range(0, len(first_ids), self.order)]
+        self.cached_blocks = cached_blocks
+        self.block_cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    # Function to read a length-prefixed compressed payload at the current file position
+    def read_compressed(self):
+        length, = LENGTH.unpack(self.file.read(LENGTH.size))
+        return zlib.decompress(self.file.read(length))
+
+    # Function to release the reader's file handle
+    def close(self):
+        self.file.close()
+
+    def __len__(self):
+        return sum(self.block_counts)
+
+    # Function to bulk-decode one block into (context id columns, run offsets, ranks, run ids, run counts)
+    def decode_block(self, block_number):
+        self.file.seek(self.block_offsets[block_number])
+        payload = self.read_compressed()
+        n_contexts, n_runs = BLOCK_HEADER.unpack_from(payload, 0)
+        pos = BLOCK_HEADER.size
+        deltas, pos = read_array(payload, U32, n_contexts, pos)
+        columns = [list(accumulate(deltas))]
+        for _ in range(self.order - 1):
+            column, pos = read_array(payload, U32, n_contexts, pos)
+            columns.append(column)
+        run_counts, pos = read_array(payload, U32, n_contexts, pos)
+        ranks, pos = read_array(payload, U32, n_contexts, pos)
+        run_ids, pos = read_array(payload, U32, n_runs, pos)
+        run_lengths, pos = read_array(payload, U32, n_runs, pos)
+        run_offsets = list(accumulate(run_counts, initial=0))
+        return columns, run_offsets, ranks, run_ids, run_lengths
+
+    # Function to fetch a decoded block through a small LRU so hot blocks are not re-decoded
+    def cached_block(self, block_number):
+        block = self.block_cache.get(block_number)
+        if block is None:
+            self.cache_misses += 1
+            block = self.decode_block(block_number)
+            self.block_cache[block_number] = block
+            if len(self.block_cache) > self.cached_blocks:
+                self.block_cache.popitem(last=False)
+        else:
+            self.cache_hits += 1
+            self.block_cache.move_to_end(block_number)
+        return block
+
+    # Function to report the share of lookups served from already-decoded blocks, then reset the counters
+    def take_cache_hit_rate(self):
+        lookups = self.cache_hits + self.cache_misses
+        hit_rate = self.cache_hits / lookups if lookups else 0.0
+        self.cache_hits = self.cache_misses = 0
+        return hit_rate
+
+    # Function to look up the (word, count) successor runs of one context, or None if absent
+    def get(self, state):
+        if len(state) != self.order:
+            return None
+        try:
+            ids = tuple(self.word_ids[word] for word in state)
+        except KeyError:
+            return None
+        block_number = bisect.bisect_right(self.first_keys, ids) - 1
+        if block_number < 0:
+            return None
+        columns, run_offsets, _, run_ids, run_lengths = self.cached_block(block_number)
+
+        # Binary search the sorted rows directly on the decoded columns
+        lo, hi = 0, len(run_offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tuple(column[mid] for column in columns) < ids:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == len(run_offsets) - 1 or tuple(column[lo] for column in columns) != ids:
+            return None
+        start, end = run_offsets[lo], run_offsets[lo + 1]
+        return [(self.vocab[word_id], count) for word_id, count in zip(run_ids[start:end], run_lengths[start:end])]
+
+    # Function to iterate over every (context, [(word, count), ...]) entry in sorted order
+    def items(self):
+        word = self.vocab.__getitem__
+        for block_number in range(len(self.first_keys)):
+            columns, run_offsets, _, run_ids, run_lengths = self.decode_block(block_number)
+            states = zip(*(map(word, column) for column in columns))
+            for i, state in enumerate(states):
+                lo, hi = run_offsets[i], run_offsets[i + 1]
+                yield state, list(zip(map(word, run_ids[lo:hi]), run_lengths[lo:hi]))
+
+    # Function to rebuild the dict-of-lists chain that gen.py generates from, in its original key order
+    def to_chain(self):
+        # Millions of new tuples and lists would otherwise trigger repeated, fruitless GC passes
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self.build_chain()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    # Function to decode every block and assemble the chain (called by to_chain)
+    def build_chain(self):
+        word = self.vocab.__getitem__
+        all_ranks = array(U32)
+        all_states = []
+        all_lists = []
+        for block_number in range(len(self.first_keys)):
+            columns, run_offsets, ranks, run_ids, run_lengths = self.decode_block(block_number)
+            all_ranks.extend(ranks)
+            all_states.extend(zip(*(map(word, column) for column in columns)))
+
+            # Expand the runs back into successor lists with C-level iterators, then slice per context
+            words = list(iter_chain.from_iterable(map(repeat, map(word, run_ids), run_lengths)))
+            ends = list(accumulate(run_lengths, initial=0))
+            bounds = [ends[offset] for offset in run_offsets]
+            all_lists.extend(map(words.__getitem__, map(slice, bounds, bounds[1:])))
+
+        order = sorted(range(len(all_ranks)), key=all_ranks.__getitem__)
+        return dict(zip(map(all_states.__getitem__, order), map(all_lists.__getitem__, order)))
+
+# Function to read the table of contents stored at the end of a compressed model
+def read_trailer(path):
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a compressed Markov model")
+        file.seek(-(TRAILER.size + len(MAGIC)), os.SEEK_END)
+        trailer_end = file.tell()
+        trailer_offset, = TRAILER.unpack(file.read(TRAILER.size))
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is truncated")
+        file.seek(trailer_offset)
+        return json.loads(zlib.decompress(file.read(trailer_end - trailer_offset)))
+
+# Function to open every chain in a compressed model for random access
+def open_compressed_model(path):
+    return {name: CompressedChainReader(path, *offsets) for name, offsets in read_trailer(path)['chains'].items()}
+
+# Function to load a compressed model fully back into dict-of-lists chains and record start lists
+def load_compressed_model(path):
+    trailer = read_trailer(path)
+    model = {}
+    for name, offsets in trailer['chains'].items():
+        reader = CompressedChainReader(path, *offsets)
+        try:
+            model[name] = reader.to_chain()
+        finally:
+            reader.close()
+    for name, states in trailer.get('starts', {}).items():
+        model[name] = [tuple(state) for state in states]
+    return model
+
+# Function to load either a pickled model or a compressed one, telling them apart by their magic bytes
+def load_any_model(model_path):
+    with open(model_path, 'rb') as file:
+        compressed = file.read(len(MAGIC)) == MAGIC
+    return load_compressed_model(model_path) if compressed else load_model(model_path)
+
+# Function to report compression ratio against pickle and decode throughput
+def compression_report(model, path, block_size=256, n_lookups=10000):
+    pickled = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+    pickled_bytes = len(pickled)
+    start_time = time.perf_counter()
+    pickle.loads(pickled)
+    pickle_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    save_compressed_model(model, path, block_size=block_size)
+    encode_time = time.perf_counter() - start_time
+    compressed_bytes = os.path.getsize(path)
+
+    start_time = time.perf_counter()
+    load_compressed_model(path)
+    decode_time = time.perf_counter() - start_time
+    chains = {name: chain for name, chain in model.items() if isinstance(chain, dict)}
+    n_contexts = sum(len(chain) for chain in chains.values())
+
+    readers = open_compressed_model(path)
+    name = max(chains, key=lambda chain_name: len(chains[chain_name]))
+    reader = readers[name]
+
+    # Cold: probes spread over the whole chain, so nearly every lookup decodes a block
+    states = list(chains[name])
+    probes = [states[(i * 7919) % len(states)] for i in range(n_lookups)]
+    start_time = time.perf_counter()
+    for state in probes:
+        reader.get(state)
+    cold_time = time.perf_counter() - start_time
+    cold_hit_rate = reader.take_cache_hit_rate()
+
+    # Warm: probes confined to as many blocks as the cache holds, after one pass to fill it
+    hot_states = sorted(states)[:block_size * reader.cached_blocks]
+    probes = [hot_states[(i * 7919) % len(hot_states)] for i in range(n_lookups)]
+    for state in hot_states:
+        reader.get(state)
+    reader.take_cache_hit_rate()
+    start_time = time.perf_counter()
+    for state in probes:
+        reader.get(state)
+    warm_time = time.perf_counter() - start_time
+    warm_hit_rate = reader.take_cache_hit_rate()
+    for reader in readers.values():
+        reader.close()
+
+    print(f"Pickle: {pickled_bytes / 1e6:.2f} MB, compressed: {compressed_bytes / 1e6:.2f} MB "
+          f"({pickled_bytes / compressed_bytes:.1f}x smaller)")
+    print(f"Encode: {encode_time:.2f}s, full decode: {decode_time:.2f}s "
+          f"({n_contexts / decode_time:,.0f} contexts/sec, {compressed_bytes / decode_time / 1e6:.1f} MB/s; "
+          f"pickle.loads {pickle_time:.2f}s)")
+    print(f"Random access on {name!r}: cold {n_lookups / cold_time:,.0f} lookups/sec "
+          f"({cold_hit_rate:.0%} block cache hits), warm {n_lookups / warm_time:,.0f} lookups/sec "
+          f"({warm_hit_rate:.0%} block cache hits)")
+    return {
+        'pickled_bytes': pickled_bytes,
+        'compressed_bytes': compressed_bytes,
+        'ratio': pickled_bytes / compressed_bytes,
+        'decode_seconds': decode_time,
+        'pickle_load_seconds': pickle_time,
+        'cold_lookups_per_sec': n_lookups / cold_time,
+        'cold_cache_hit_rate': cold_hit_rate,
+        'warm_lookups_per_sec': n_lookups / warm_time,
+        'warm_cache_hit_rate': warm_hit_rate,
+    }
+
+# Compress a model written by gen.save_model and report the ratio and decode throughput
+def main():
+    model_path = sys.argv[1] if len(sys.argv) > 1 else input("Enter the path to a pickled model: ")
+    output_path = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(model_path)[0] + '.mkvz'
+    compression_report(load_model(model_path), output_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import re
+import sys
+import time
+from array import array
+from collections import Counter
+
+from gen import load_texts
+
+# Approximate streaming counter: never underestimates, overestimates by at most ~e*N/width w.h.p.
+class CountMinSketch:
+    def __init__(self, width=1 << 20, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array('I', bytes(4 * width)) for _ in range(depth)]
+
+    # Function to find the counter index of a key in every row
+    def indexes(self, key):
+        return [hash((row, key)) % self.width for row in range(self.depth)]
+
+    # Function to count one occurrence using conservative update (only raise the minimum counters)
+    def add(self, key):
+        indexes = self.indexes(key)
+        current = min(self.rows[row][i] for row, i in enumerate(indexes))
+        for row, i in enumerate(indexes):
+            if self.rows[row][i] == current:
+                self.rows[row][i] = current + 1
+
+    # Function to estimate how many times a key was added
+    def estimate(self, key):
+        return min(self.rows[row][i] for row, i in enumerate(self.indexes(key)))
+
+    # Function to report the memory held by the counters
+    def size_bytes(self):
+        return sum(row.itemsize * len(row) for row in self.rows)
+
+# Function to iterate over every (context, next word) transition of the sentence chain
+def sentence_transitions(text, order):
+    for sentence in re.split(r'(?<=[.!?])\s+', text):
+        words = sentence.split()
+        for i in range(len(words) - order):
+            yield tuple(words[i:i + order]), words[i + order]
+
+# Function to build a sentence-based Markov Chain, pruning rare contexts and successors while building
+def build_pruned_sentence_markov_chain(text, order=3, min_context_count=1, min_successor_count=1,
+                                       top_k=None, sketch_width=1 << 20, sketch_depth=4):
+    # Pass 1: stream approximate counts so the exact table is never materialized for rare entries
+    context_sketch = CountMinSketch(sketch_width, sketch_depth) if min_context_count > 1 else None
+    successor_sketch = CountMinSketch(sketch_width, sketch_depth) if min_successor_count > 1 else None
+    if context_sketch or successor_sketch:
+        for key, next_word in sentence_transitions(text, order):
+            if context_sketch:
+                context_sketch.add(key)
+            if successor_sketch:
+                successor_sketch.add((key, next_word))
+
+    # Pass 2: keep only transitions whose estimates clear the thresholds. A sketch never
+    # underestimates, so everything dropped here is truly below threshold. Exact context
+    # counts are only kept for contexts that survive the sketch, and only when needed
+    markov_chain = {}
+    context_counts = Counter() if context_sketch else None
+    for key, next_word in sentence_transitions(text, order):
+        if context_sketch:
+            if context_sketch.estimate(key) < min_context_count:
+                continue
+            context_counts[key] += 1
+        if successor_sketch and successor_sketch.estimate((key, next_word)) < min_successor_count:
+            continue
+        if key not in markov_chain:
+            markov_chain[key] = []
+        markov_chain[key].append(next_word)
+
+    if not (context_sketch or successor_sketch or top_k is not None):
+        return markov_chain
+
+    # Exact cleanup of the survivors, removing entries the sketches overestimated, then top-k
+    for key in list(markov_chain):
+        if context_counts is not None and context_counts[key] < min_context_count:
+            del markov_chain[key]
+            continue
+        successor_counts = Counter(markov_chain[key])
+        keep = {word for word, count in successor_counts.items() if count >= min_successor_count}
+        if top_k is not None:
+            # Counter.most_common breaks ties by first appearance, keeping the result deterministic
+            ranked = [word for word, _ in successor_counts.most_common() if word in keep]
+            keep = set(ranked[:top_k])
+        next_words = [word for word in markov_chain[key] if word in keep]
+        if next_words:
+            markov_chain[key] = next_words
+        else:
+            del markov_chain[key]
+    return markov_chain
+
+# Function to approximate the memory held by a dict-of-lists chain (word strings are shared and excluded)
+def chain_size_bytes(chain):
+    size = sys.getsizeof(chain)
+    for key, next_words in chain.items():
+        size += sys.getsizeof(key) + sys.getsizeof(next_words)
+    return size
+
+# Function to compute the memory the count-min sketches of a pruning setting hold while the chain is built
+def sketch_size_bytes(min_context_count=1, min_successor_count=1, top_k=None, sketch_width=1 << 20, sketch_depth=4):
+    n_sketches = (min_context_count > 1) + (min_successor_count > 1)
+    return n_sketches * sketch_depth * sketch_width * array('I').itemsize
+
+# Function to compare chain size, sketch size and build throughput across pruning settings
+def pruning_report(text, settings, order=4):
+    n_transitions = sum(1 for _ in sentence_transitions(text, order))
+    results = []
+    print(f"{'setting':<40} {'contexts':>10} {'transitions':>12} {'size MB':>9} {'sketch MB':>10} "
+          f"{'build s':>8} {'tok/s':>12}")
+    for setting in settings:
+        start_time = time.perf_counter()
+        chain = build_pruned_sentence_markov_chain(text, order=order, **setting)
+        build_time = time.perf_counter() - start_time
+        result = {
+            'setting': setting,
+            'contexts': len(chain),
+            'transitions': sum(len(next_words) for next_words in chain.values()),
+            'size_bytes': chain_size_bytes(chain),
+            'sketch_bytes': sketch_size_bytes(**setting),
+            'build_seconds': build_time,
+            'tokens_per_sec': n_transitions / build_time if build_time else float('inf'),
+        }
+        results.append(result)
+        label = ', '.join(f"{name}={value}" for name, value in setting.items()) or 'unpruned'
+        print(f"{label:<40} {result['contexts']:>10} {result['transitions']:>12} "
+              f"{result['size_bytes'] / 1e6:>9.2f} {result['sketch_bytes'] / 1e6:>10.2f} "
+              f"{build_time:>8.2f} {result['tokens_per_sec']:>12,.0f}")
+    return results
+
+# Report the size/throughput trade-off of a few pruning settings on a folder of training texts
+def main():
+    folder_path = sys.argv[1] if len(sys.argv) > 1 else input("Enter the path to the folder with text files: ")
+    text = load_texts(folder_path)
+    pruning_report(text, [
+        {},
+        {'min_context_count': 2},
+        {'min_successor_count': 2},
+        {'min_context_count': 2, 'min_successor_count': 2},
+        {'top_k': 3},
+        {'min_context_count': 2, 'top_k': 3},
+    ])
+
+if __name__ == "__main__":
+    main()
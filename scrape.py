@@ -1,10 +1,12 @@
-import requests
-from bs4 import BeautifulSoup
 import os
 import time
 
 # Function to get the top N works' URLs from Project Gutenberg with pagination support
 def get_top_works_urls(n):
+    # Scraping dependencies load on first use, keeping them off every other import path
+    import requests
+    from bs4 import BeautifulSoup
+
     base_url = "https://www.gutenberg.org/ebooks/search/?sort_order=downloads&start_index="
     ebook_links = []
     start_index = 1
@@ -33,6 +35,9 @@ def get_top_works_urls(n):
 
 # Function to get the title and .txt link for a given work
 def get_title_and_txt_link(ebook_url):
+    import requests
+    from bs4 import BeautifulSoup
+
     try:
         response = requests.get(ebook_url, timeout=10)
         response.raise_for_status()  # Check for HTTP request errors
@@ -61,6 +66,8 @@ def get_title_and_txt_link(ebook_url):
 
 # Function to download the .txt file with retry logic
 def download_txt(url, folder, title, retries=3):
+    import requests
+
     try:
         for attempt in range(retries):
             response = requests.get(url, timeout=10)
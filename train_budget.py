@@ -0,0 +1,234 @@
+import heapq
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+from gen import build_record_model
+from model_io import chain_items, chain_vocab, write_model_sections
+
+# Approximate CPython costs used to track model memory without walking the whole table
+DICT_ENTRY_BYTES = 72  # hash slot plus amortized resizing slack
+EMPTY_DICT_BYTES = sys.getsizeof({})
+SUCCESSOR_BYTES = DICT_ENTRY_BYTES + sys.getsizeof(1)
+
+# Tracks the estimated memory held by the in-progress counts and the vocabulary
+class MemoryTracker:
+    def __init__(self):
+        self.contexts = 0
+        self.successors = 0
+        self.vocab_words = 0
+        self.context_bytes = 0
+        self.successor_bytes = 0
+        self.vocab_bytes = 0
+
+    # Function to estimate the bytes held by the count table, which is what spilling frees
+    def counts_bytes(self):
+        return self.context_bytes + self.successor_bytes
+
+    # Function to count one context and its distinct successors, as added to the count table
+    def add_context(self, state, n_successors):
+        self.contexts += 1
+        self.context_bytes += sys.getsizeof(state) + EMPTY_DICT_BYTES + DICT_ENTRY_BYTES
+        self.successors += n_successors
+        self.successor_bytes += n_successors * SUCCESSOR_BYTES
+
+    # Function to estimate everything held in memory, which is what the budget limits
+    def total_bytes(self):
+        return self.counts_bytes() + self.vocab_bytes
+
+    # Function to forget the count table after it has been spilled to disk
+    def reset_counts(self):
+        self.contexts = self.successors = self.context_bytes = self.successor_bytes = 0
+
+    # Function to summarize memory use for progress reports
+    def report(self):
+        return {
+            'contexts': self.contexts,
+            'successors': self.successors,
+            'vocab_words': self.vocab_words,
+            'context_bytes': self.context_bytes,
+            'successor_bytes': self.successor_bytes,
+            'vocab_bytes': self.vocab_bytes,
+            'total_bytes': self.total_bytes(),
+        }
+
+# Function to print one progress line
+def print_progress(progress):
+    print(f"{progress['files_done']}/{progress['files_total']} files, {progress['tokens']:,} tokens, "
+          f"{progress['contexts']:,} contexts, {progress['successors']:,} successors, "
+          f"{progress['vocab_words']:,} words, ~{progress['total_bytes'] / 1e6:.1f} MB, "
+          f"{progress['runs_spilled']} runs spilled")
+
+# Function to write the current counts to disk as one sorted run, one context per line
+def spill_run(counts, spill_dir, run_number):
+    path = os.path.join(spill_dir, f"run_{run_number:05d}.txt")
+    with open(path, 'w', encoding='utf-8', buffering=1 << 20) as file:
+        for state in sorted(counts):
+            successors = ' '.join(f"{word} {count}" for word, count in counts[state].items())
+            file.write(f"{' '.join(state)}\t{successors}\n")
+    return path
+
+# Function to stream the (context, [(word, count), ...]) entries of one sorted run
+def read_run(path):
+    with open(path, 'r', encoding='utf-8', buffering=1 << 20) as file:
+        for line in file:
+            state, successors = line.rstrip('\n').split('\t')
+            fields = successors.split(' ')
+            yield tuple(state.split(' ')), [(fields[i], int(fields[i + 1])) for i in range(0, len(fields), 2)]
+
+# Function to k-way merge sorted runs, summing the successor counts of contexts seen in several runs
+def merge_runs(paths):
+    merged = heapq.merge(*(read_run(path) for path in paths), key=lambda entry: entry[0])
+    current_state = None
+    current = {}
+    for state, successors in merged:
+        if state != current_state:
+            if current_state is not None:
+                yield current_state, list(current.items())
+            current_state = state
+            current = {}
+        for word, count in successors:
+            current[word] = current.get(word, 0) + count
+    if current_state is not None:
+        yield current_state, list(current.items())
+
+# Function to merge runs in passes of at most max_fan_in files, so the merge never holds too many open files
+def reduce_runs(runs, spill_dir, max_fan_in):
+    runs = list(runs)
+    merge_number = 0
+    while len(runs) > max_fan_in:
+        group, runs = runs[:max_fan_in], runs[max_fan_in:]
+        path = os.path.join(spill_dir, f"merged_{merge_number:05d}.txt")
+        merge_number += 1
+        with open(path, 'w', encoding='utf-8', buffering=1 << 20) as file:
+            for state, successors in merge_runs(group):
+                file.write(f"{' '.join(state)}\t{' '.join(f'{word} {count}' for word, count in successors)}\n")
+        for old_path in group:
+            os.remove(old_path)
+        runs.append(path)
+    return runs
+
+# Function to train the sentence chain within a memory budget, writing a compressed model to output_path.
+# When the count table outgrows the budget it is spilled as a sorted run and the runs are merged at the end
+def train_with_budget(folder_path, output_path, order=4, memory_budget=None, spill_dir=None,
+                      extra_chains=None, progress=print_progress, progress_every=1, max_fan_in=256):
+    file_names = sorted(name for name in os.listdir(folder_path) if name.endswith(".txt"))
+    tracker = MemoryTracker()
+    counts = {}
+    vocab = set()
+    runs = []
+    runs_spilled = 0
+    tokens = 0
+    own_spill_dir = spill_dir is None
+    spill_dir = spill_dir or tempfile.mkdtemp(prefix='markov_runs_')
+    os.makedirs(spill_dir, exist_ok=True)
+    start_time = time.perf_counter()
+
+    def report(files_done):
+        progress_report = tracker.report()
+        progress_report.update({
+            'files_done': files_done,
+            'files_total': len(file_names),
+            'tokens': tokens,
+            'runs_spilled': runs_spilled,
+            'seconds': time.perf_counter() - start_time,
+        })
+        return progress_report
+
+    try:
+        for files_done, file_name in enumerate(file_names, 1):
+            with open(os.path.join(folder_path, file_name), 'r', encoding='utf-8') as file:
+                text = file.read()
+            for sentence in re.split(r'(?<=[.!?])\s+', text):
+                words = sentence.split()
+                tokens += len(words)
+                for word in words:
+                    if word not in vocab:
+                        vocab.add(word)
+                        tracker.vocab_words += 1
+                        tracker.vocab_bytes += sys.getsizeof(word) + DICT_ENTRY_BYTES
+                for i in range(len(words) - order):
+                    key = tuple(words[i:i + order])
+                    successors = counts.get(key)
+                    if successors is None:
+                        successors = counts[key] = {}
+                        tracker.add_context(key, 0)
+                    next_word = words[i + order]
+                    if next_word in successors:
+                        successors[next_word] += 1
+                    else:
+                        successors[next_word] = 1
+                        tracker.successors += 1
+                        tracker.successor_bytes += SUCCESSOR_BYTES
+
+                # The vocabulary is never spilled, so once it alone fills the budget no amount of spilling can help
+                if memory_budget is not None and tracker.vocab_bytes >= memory_budget:
+                    raise MemoryError(f"The vocabulary alone needs ~{tracker.vocab_bytes / 1e6:.1f} MB, "
+                                      f"over the {memory_budget / 1e6:.1f} MB memory budget")
+                if memory_budget is not None and counts and tracker.total_bytes() >= memory_budget:
+                    runs.append(spill_run(counts, spill_dir, runs_spilled))
+                    runs_spilled += 1
+                    counts = {}
+                    tracker.reset_counts()
+            if progress and files_done % progress_every == 0:
+                progress(report(files_done))
+
+        # Only spill the tail when earlier runs exist; otherwise the in-memory table is written directly
+        if runs and counts:
+            runs.append(spill_run(counts, spill_dir, runs_spilled))
+            runs_spilled += 1
+            counts = {}
+            tracker.reset_counts()
+        runs = reduce_runs(runs, spill_dir, max_fan_in)
+        entries = merge_runs(runs) if runs else ((state, list(counts[state].items())) for state in sorted(counts))
+
+        # Spilling reset the tracker, so the final totals are recounted from the merged entries as they stream past
+        tracker.reset_counts()
+
+        def fill(writer):
+            for state, successors in entries:
+                writer.add(state, successors)
+                tracker.add_context(state, len(successors))
+
+        sections = [('sentence_chain', sorted(vocab), order, fill)]
+        starts = {}
+        for name, chain in (extra_chains or {}).items():
+            if isinstance(chain, list):
+                starts[name] = chain
+                continue
+
+            def fill_extra(writer, chain=chain):
+                for state, successors, rank in chain_items(chain):
+                    writer.add(state, successors, rank)
+
+            sections.append((name, chain_vocab(chain), len(next(iter(chain))), fill_extra))
+        write_model_sections(output_path, sections, starts=starts)
+    finally:
+        if own_spill_dir:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+        else:
+            for path in runs:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    final_report = report(len(file_names))
+    if progress:
+        progress(final_report)
+    return final_report
+
+# Train a full compressed model within a memory budget given in MB; only the sentence chain is budgeted,
+# the title and author chains are small and are built from the CSV as gen.build_model does
+def main():
+    folder_path = sys.argv[1] if len(sys.argv) > 1 else input("Enter the path to the folder with text files: ")
+    output_path = sys.argv[2] if len(sys.argv) > 2 else 'model.mkvz'
+    budget_mb = float(sys.argv[3]) if len(sys.argv) > 3 else float(input("Enter the memory budget in MB: "))
+    csv_file = sys.argv[4] if len(sys.argv) > 4 else 'extracted_titles_and_authors.csv'
+    train_with_budget(folder_path, output_path, order=4, memory_budget=int(budget_mb * 1024 * 1024),
+                      extra_chains=build_record_model(csv_file))
+    print(f"Model saved to {output_path}")
+
+if __name__ == "__main__":
+    main()
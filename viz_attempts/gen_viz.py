@@ -2,8 +2,6 @@ import os
 import random
 import re
 import time
-import networkx as nx
-import matplotlib.pyplot as plt
 from collections import defaultdict
 
 # Function to load text files from a folder
@@ -38,6 +36,10 @@ def build_sentence_markov_chain(text, order=3):
 
 # Function to visualize the Markov model as a graph
 def visualize_markov_chain(chain, limit=50):
+    # Plotting libraries are imported on first use so text-only runs start fast
+    import networkx as nx
+    import matplotlib.pyplot as plt
+
     G = nx.DiGraph()
 
     # Add edges to the graph with limited transitions for faster visualization
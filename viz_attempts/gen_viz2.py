@@ -2,8 +2,6 @@ import os
 import random
 import re
 import time
-import matplotlib.pyplot as plt
-import numpy as np
 from collections import defaultdict
 
 # Function to load text files from a folder
@@ -51,6 +49,9 @@ def prepare_parallel_coordinates_data(chain, limit=50):
 
 # Function to visualize the Markov model as parallel coordinates using Matplotlib
 def visualize_parallel_coordinates(data):
+    import matplotlib.pyplot as plt
+    import numpy as np
+
     # Convert word data into numerical form for visualization
     all_words = set(word for row in data for word in row)
     word_to_num = {word: i for i, word in enumerate(all_words)}
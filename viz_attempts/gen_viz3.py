@@ -2,8 +2,6 @@ import os
 import random
 import re
 import time
-import plotly.express as px
-import numpy as np
 from collections import defaultdict
 
 # Function to load text files from a folder
@@ -44,6 +42,9 @@ def word_to_num_mapping(chain):
 
 # Function to visualize the Markov model using plotly parallel coordinates
 def visualize_parallel_coordinates(chain):
+    import plotly.express as px
+    import numpy as np
+
     word_map = word_to_num_mapping(chain)
     
     # Prepare data for parallel coordinates
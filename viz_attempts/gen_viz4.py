@@ -2,11 +2,7 @@ import os
 import random
 import re
 import time
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from collections import defaultdict, Counter
-from scipy.sparse import lil_matrix
 
 # Function to load text files from a folder
 def load_texts(folder_path):
@@ -37,6 +33,8 @@ def build_sentence_markov_chain(text, order=3):
 
 # Function to calculate transition matrix in pieces
 def build_transition_matrix(chain, vocab_size=1000, resolution=10):
+    import numpy as np
+
     # Get the top `vocab_size` most common words
     all_words = [word for state in chain.keys() for word in state] + [word for words in chain.values() for word in words]
     common_words = [word for word, count in Counter(all_words).most_common(vocab_size)]
@@ -67,6 +65,9 @@ def build_transition_matrix(chain, vocab_size=1000, resolution=10):
 
 # Function to generate a heatmap of the transition matrix
 def generate_heatmap(transition_matrix, folder_name, resolution):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     plt.figure(figsize=(12, 10))
     sns.heatmap(transition_matrix, cmap="Blues", cbar=True)
     plt.title(f'Markov Chain Transition Matrix Heatmap (Resolution: {resolution})')